@@ -149,6 +149,14 @@ SVG_TEXT_TAG = inkex.addNS('text', 'svg')
 SVG_LABEL_TAG = inkex.addNS('label', 'inkscape')
 
 GCODE_EXTENSION = 'gcode'
+INDEX_EXTENSION = 'index.json'
+
+IDENTITY_TRANSFORM = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+FLIP_TRANSFORM = [[1.0, 0.0, 0.0], [0.0, -1.0, 0.0]]
+
+# Path data made up only of moveto/lineto/closepath commands
+RE_POLYLINE_PATH = re.compile(r'^[\sMmLlZz\d.,eE+-]*$')
+RE_PATH_TOKEN = re.compile(r'[MmLlZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
 
 options = {}
 
@@ -226,6 +234,68 @@ def csplength(csp):
     return lengths, total
 
 
+###
+###        Fast path for polyline path data
+###
+
+# Parses path data consisting only of M/L/Z commands (absolute or relative) into
+# the same CubicSuperPath cubicsuperpath.parsePath would produce, applying the
+# transform `mat` on the way. Returns None for anything else, e.g. curves, so
+# the caller can fall back to the general parser.
+def parse_polyline_path(d, mat):
+    if not RE_POLYLINE_PATH.match(d):
+        return None
+    # findall skips anything that isn't a token, e.g. an e or E not part of
+    # a number, so make sure only separators are left over
+    if RE_PATH_TOKEN.sub('', d).strip(' \t\r\n,'):
+        return None
+    (a, c, e), (b, dd, f) = mat
+
+    csp = []
+    subpath = None
+    start = None
+    x, y = 0.0, 0.0
+    cmd = None
+    tokens = RE_PATH_TOKEN.findall(d)
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in 'MmLlZz':
+            cmd = token
+            i += 1
+            if cmd in 'Zz':
+                if subpath is None:
+                    return None
+                # close back to the start, which becomes the current point
+                x, y = start
+                tx, ty = a*x + c*y + e, b*x + dd*y + f
+                subpath.append([[tx, ty], [tx, ty], [tx, ty]])
+                cmd = None
+            continue
+
+        if cmd is None or i + 1 >= len(tokens):
+            return None
+        px, py = float(tokens[i]), float(tokens[i+1])
+        i += 2
+        if cmd in 'ml':
+            px, py = px + x, py + y
+        x, y = px, py
+
+        if cmd in 'Mm':
+            subpath = []
+            csp.append(subpath)
+            start = (x, y)
+            # further coordinate pairs are implicit linetos
+            cmd = cmd == 'M' and 'L' or 'l'
+        elif subpath is None:
+            return None
+        tx, ty = a*x + c*y + e, b*x + dd*y + f
+        subpath.append([[tx, ty], [tx, ty], [tx, ty]])
+
+    if not csp:
+        return None
+    return csp
+
 ###
 ###        Distance calculattion from point to arc
 ###
@@ -409,7 +479,15 @@ class Gcode_tools(inkex.Effect):
 
         self.last_pos = None
 
+        # parsed transform attributes, keyed by their source text
+        self.transforms = {}
+
+        # use millimeters
+        self.unitScale = 0.282222222222
+
         self.RE_COORD = re.compile(r'([XYZIJK])(\-?\d+(\.\d+)?)')
+        self.RE_FEED = re.compile(r'F(\d+(\.\d+)?)')
+        self.RE_DWELL = re.compile(r'G4 ?P(\d+(\.\d+)?)')
 
         self.OptionParser.add_option("", "--tab", action="store", type="string", dest="tab", default="", help="Means nothing right now. Notebooks Tab.")
         self.OptionParser.add_option('-d', '--directory', action='store', type='string', dest='directory', default=outdir, help='Directory for gcode file')
@@ -445,6 +523,15 @@ class Gcode_tools(inkex.Effect):
         else:
             return path
 
+    # simpletransform.parseTransform, memoized -- OSM documents repeat the same
+    # handful of transforms across thousands of nodes
+    def parse_transform(self, transform):
+        if not transform:
+            return IDENTITY_TRANSFORM
+        if transform not in self.transforms:
+            self.transforms[transform] = simpletransform.parseTransform(transform)
+        return self.transforms[transform]
+
     def check_dir(self):
         if not os.path.isdir(self.options.directory):
             inkex.errormsg(('Directory specified for output gcode does not exist! Please create it.'))
@@ -557,31 +644,34 @@ class Gcode_tools(inkex.Effect):
     ###
     ################################################################################
     def compile_paths(self, parent, node, trans):
-        # Apply the object transform, along with the parent transformation
-        mat = node.get('transform', None)
+        # Apply the object transform, along with the parent transformation. The
+        # result is passed down, so a group's transform is only composed once.
+        mat = self.parse_transform(node.get('transform', None))
         path = {}
 
-        if mat:
-            mat = simpletransform.parseTransform(mat)
+        if mat != IDENTITY_TRANSFORM:
             trans = simpletransform.composeTransform(trans, mat)
 
         if node.tag == SVG_PATH_TAG:
             # This is a path object
             if (not node.get('d')):
                 return []
-            csp = cubicsuperpath.parsePath(node.get('d'))
 
             path['type'] = 'vector'
             path['id'] = node.get('id')
-            path['data'] = []
 
-            if trans:
-                simpletransform.applyTransformToPath(trans, csp)
-                path['data'] = csp
+            # straight lines (e.g. everything OSM renders to) are read in one
+            # pass, with the transform and vertical flip applied together
+            csp = parse_polyline_path(node.get('d'), simpletransform.composeTransform(FLIP_TRANSFORM, trans))
+            if csp is None:
+                csp = cubicsuperpath.parsePath(node.get('d'))
+
+                if trans != IDENTITY_TRANSFORM:
+                    simpletransform.applyTransformToPath(trans, csp)
+
+                # flip vertically
+                simpletransform.applyTransformToPath(FLIP_TRANSFORM, csp)
 
-            # flip vertically
-            csp = path['data']
-            simpletransform.applyTransformToPath(([1.0, 0.0, 0], [0.0, -1.0, 0]), csp)
             path['data'] = csp
 
             return path
@@ -709,10 +799,56 @@ class Gcode_tools(inkex.Effect):
             out += '\n'
         return out
 
+    # Builds the sidecar index for finished gcode: for every '; id' comment, the
+    # byte offset of that line, the estimated time spent drawing up to it and the
+    # machine state (pen, position) at that point. Arcs are estimated as chords.
+    def index_gcode(self, gcode):
+        paths = []
+        offset = 0
+        elapsed = 0.0
+        feed = None
+        pos = [None, None]
+        pen_is_down = False
+        for line in gcode.split('\n'):
+            if line.startswith('; id '):
+                paths.append({
+                    'id': line[len('; id '):],
+                    'offset': offset,
+                    'time': round(elapsed, 3),
+                    'pen_down': pen_is_down,
+                    'x': pos[0],
+                    'y': pos[1],
+                })
+            elif line == PEN_DOWN.split('\n')[0]:
+                pen_is_down = True
+            elif line == PEN_UP.split('\n')[0]:
+                pen_is_down = False
+            elif self.RE_DWELL.match(line):
+                elapsed += float(self.RE_DWELL.match(line).group(1))
+            elif line.split(' ')[0] in ('G00', 'G01', 'G02', 'G03'):
+                target = pos[:]
+                for line_part in line.split(' ')[1:]:
+                    m = self.RE_COORD.match(line_part)
+                    if m is not None and m.group(1) in ('X', 'Y'):
+                        target[m.group(1) == 'Y' and 1 or 0] = float(m.group(2))
+                    m = self.RE_FEED.match(line_part)
+                    if m is not None:
+                        feed = float(m.group(1))
+                if feed and None not in pos and None not in target:
+                    elapsed += math.hypot(target[0] - pos[0], target[1] - pos[1]) / feed * 60
+                pos = target
+            offset += len(line) + 1
+        return {
+            'pen_up': PEN_UP,
+            'pen_down': PEN_DOWN,
+            'feed': feed,
+            'time': round(elapsed, 3),
+            'paths': paths,
+        }
+
     def effect(self):
-        global options
-        options = self.options
-        selected = self.selected.values()
+        # a set, since every child of every layer is looked up in it
+        selected = set(self.selected.values())
 
         root = self.document.getroot()
 
@@ -734,61 +870,61 @@ class Gcode_tools(inkex.Effect):
         if (not dirExists):
             return
 
-        gcode = ''
-
-        # use millimeters
-        self.unitScale = 0.282222222222
-
-        selected = list(selected)
-
         # Recursively compiles a list of paths that are decendant from the given node
         self.skipped = 0
 
-        # Compile a list of layers in this document. We compile a list of only the layers
-        # we need to use, so we can know ahead of time whether to put tool change
-        # operations between them.
-        layers = []
-        for layer in reversed(get_layers(self.document)):
-            for node in layer.iterchildren():
-                if (node in selected):
-                    layers.append(layer)
-                    break
-
         layers = list(reversed(get_layers(self.document)))
 
         # Loop over the layers and objects
-        gcode_output = {}
+        layer_paths = []
         for layer in layers:
-            gcode = ''
-            gcode_raster = ''
-
             logger.info('layer: %s' % layer.attrib['id'])
 
-            gcode += '; STARTING LAYER %s\n' % layer.attrib['id']
-
             pathList = []
 
             # Apply the layer transform to all objects within the layer
-            trans = layer.get('transform', None)
-            trans = simpletransform.parseTransform(trans)
+            trans = self.parse_transform(layer.get('transform', None))
 
             for node in layer.iterchildren():
                 if (node in selected):
                     # Vector path data, cut from x to y in a line or curve
                     logger.info('node %s' % str(node.tag))
-                    selected.remove(node)
+                    selected.discard(node)
 
-                    try:
-                        newPath = self.compile_paths(self, node, trans).copy()
+                    data = self.compile_paths(self, node, trans)
+                    if type(data) is not list:
+                        newPath = data.copy()
                         pathList.append(newPath)
                         inkex.errormsg('Built gcode for '+str(node.get('id'))+' - will be cut as %s.' % (newPath['type']) )
-                    except:
-                        for objectData in self.compile_paths(self, node, trans):
+                    else:
+                        for objectData in data:
                             inkex.errormsg('Built gcode for group '+str(node.get('id'))+', item %s - will be cut as %s.' % (objectData['id'], objectData['type']) )
                             pathList.append(objectData)
                 else:
                     logger.info('skipping node %s' % node)
 
+            layer_paths.append((layer.attrib['id'], pathList))
+
+        self.export_layers(layer_paths)
+
+        if (self.skipped > 0):
+            inkex.errormsg('Warning: skipped %d object(s) because they were not paths (Vectors) or images (Raster). Please convert them to paths using the menu \'Path->Object To Path\'' % self.skipped)
+
+    # Orders the paths of each layer for continuous drawing, turns them into gcode
+    # and writes one file per layer, all translated to a shared origin and scaled
+    # to fit. Takes a list of (layer id, list of compiled paths) pairs.
+    def export_layers(self, layer_paths):
+        global options
+        options = self.options
+
+        # Loop over the layers and objects
+        gcode_output = {}
+        for (layer_id, pathList) in layer_paths:
+            gcode = ''
+            gcode_raster = ''
+
+            gcode += '; STARTING LAYER %s\n' % layer_id
+
             if (not pathList):
                 logger.info('no objects in layer')
                 continue
@@ -822,7 +958,7 @@ class Gcode_tools(inkex.Effect):
                     ordered_path_list.append(closest_path)
                 pathList.remove(closest_path)
 
-            logger.info('found %d paths in layer %s' % (len(ordered_path_list), layer.attrib['id']))
+            logger.info('found %d paths in layer %s' % (len(ordered_path_list), layer_id))
 
             # Fetch the vector or raster data and turn it into GCode
             for (i, objectData) in enumerate(ordered_path_list):
@@ -852,7 +988,7 @@ class Gcode_tools(inkex.Effect):
             self.pen_is_down = False
             gcode += '; ORDERED PATH LIST END / PEN UP\n'
 
-            gcode_output[layer.attrib['id']] = '\n\n'.join(['G21 ; All units in mm', gcode_raster, gcode])
+            gcode_output[layer_id] = '\n\n'.join(['G21 ; All units in mm', gcode_raster, gcode])
 
         # calculate origin offset for generated gcode
         extents = None
@@ -867,6 +1003,10 @@ class Gcode_tools(inkex.Effect):
 
         logger.info('extents: %s' % str(extents))
 
+        if extents is None:
+            inkex.errormsg('No paths to export.')
+            return
+
         # translate gcode by shared offset & optional scale, write file(s)
         splode = 1.0
         if self.options.Xsplode != '' and self.options.Xsplode is not None:
@@ -885,15 +1025,19 @@ class Gcode_tools(inkex.Effect):
         for layer_id in gcode_output:
             try:
                 fn = os.path.normpath('%s/%s.%s' % (self.options.directory, layer_id, GCODE_EXTENSION))
-                with open(fn, 'w') as f:
-                    f.write(self.transform_gcode(gcode_output[layer_id], -1 * extents[0], -1 * extents[1], splode, splode))
+                gcode = self.transform_gcode(gcode_output[layer_id], -1 * extents[0], -1 * extents[1], splode, splode)
+                # binary, so the byte offsets in the index hold on every platform
+                with open(fn, 'wb') as f:
+                    f.write(gcode)
+                index = self.index_gcode(gcode)
+                index['gcode'] = os.path.basename(fn)
+                with open('%s.%s' % (os.path.splitext(fn)[0], INDEX_EXTENSION), 'w') as f:
+                    json.dump(index, f, indent=1)
             except:
                 inkex.errormsg('Cannot write to %s file.' % fn)
                 return
 
-        if (self.skipped > 0):
-            inkex.errormsg('Warning: skipped %d object(s) because they were not paths (Vectors) or images (Raster). Please convert them to paths using the menu \'Path->Object To Path\'' % self.skipped)
-
-e = Gcode_tools()
-e.affect()
-inkex.errormsg('Finished processing.')
+if __name__ == '__main__':
+    e = Gcode_tools()
+    e.affect()
+    inkex.errormsg('Finished processing.')
@@ -0,0 +1,63 @@
+#!/bin/bash
+
+# shared settings for the load/excerpt scripts -- source, don't execute
+
+DBNAME="osm"
+TMP="/tmp/4xidraw"
+
+# MB of RAM osm2pgsql may use to cache nodes, shared by parallel imports
+CACHE="${CACHE:-800}"
+
+# LAYER_NAME|TABLE_NAME|WHERE_CLAUSE, one per line
+CRITERIA="road|planet_osm_line|highway IS NOT NULL AND highway NOT IN ('service', 'cycleway')
+alley|planet_osm_line|highway='service'
+bicycle|planet_osm_line|route='bicycle' OR highway='cycleway'
+train|planet_osm_line|route='train'
+building|planet_osm_polygon|building IS NOT NULL
+greenspace|planet_osm_polygon|landuse='grass' OR leisure='park'"
+if [ -n "${LAYERS:-}" ]; then CRITERIA="${LAYERS:-}"; fi
+
+# osm2pgsql appends rows in spherical mercator; move anything that hasn't been
+# converted to lon/lat yet. takes an optional table prefix.
+reproject() {
+    local prefix="${1:-planet_osm}"
+    for g in line point polygon; do
+        echo "
+            UPDATE ${prefix}_$g SET way = ST_TRANSFORM( ST_SETSRID( way, 900913), 4326 )
+                WHERE ST_SRID(way) <> 4326;" | psql -U postgres $DBNAME
+    done
+}
+
+# combines the extract_N tables of a multi-extract load into the planet_osm
+# tables the excerpts read from. features present in more than one extract
+# are taken from just one of them: the prefix given (the extract a change
+# file was just applied to) if it has the feature, otherwise the first. all
+# of that extract's rows are kept, since osm2pgsql splits long ways and
+# multipolygons into several rows sharing an osm_id.
+merge_extracts() {
+    local preferred="${1:-}"
+    local prefixes="$(echo "SELECT regexp_replace(tablename, '_line$', '') FROM pg_tables
+        WHERE tablename ~ '^extract_[0-9]+_line$' ORDER BY tablename;" | psql -U postgres -t -A $DBNAME)"
+    for g in line point polygon; do
+        echo "- merging extracts into planet_osm_$g"
+        local union=""
+        local rank=1
+        for prefix in $prefixes; do
+            if [ -n "$union" ]; then union="$union UNION ALL "; fi
+            if [ "$prefix" = "$preferred" ]; then
+                union="${union}SELECT 0 AS extract_rank, * FROM ${prefix}_$g"
+            else
+                union="${union}SELECT $rank AS extract_rank, * FROM ${prefix}_$g"
+            fi
+            rank=$((rank + 1))
+        done
+        echo "
+            DROP TABLE IF EXISTS planet_osm_$g;
+            CREATE TABLE planet_osm_$g AS
+                SELECT * FROM (
+                    SELECT *, min(extract_rank) OVER (PARTITION BY osm_id) AS best_rank FROM ($union) AS extracts
+                ) AS ranked WHERE extract_rank = best_rank;
+            ALTER TABLE planet_osm_$g DROP COLUMN extract_rank, DROP COLUMN best_rank;" | \
+            psql -U postgres -q -v ON_ERROR_STOP=1 $DBNAME
+    done
+}
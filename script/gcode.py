@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+'''
+Exports the OSM features inside a clip polygon straight to per-layer gcode.
+
+This skips the SVG and Inkscape steps for unattended jobs: each layer is read
+from PostGIS as polylines in the same coordinates render.py would draw them
+at, then handed to the 4xiDraw exporter for path ordering, scaling and gcode
+generation. --directory, --Xsplode, --Ysplode and --collapsepaths are passed
+on to the exporter (see inkscape/4xidraw.py).
+
+The exporter needs Inkscape's extension modules (inkex, simpletransform...),
+so run this with them on the path, e.g.
+PYTHONPATH=/usr/share/inkscape/extensions.
+'''
+
+from __future__ import print_function
+
+import argparse
+import imp
+import json
+import os
+import sys
+
+import render
+
+EXPORTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inkscape', '4xidraw.py')
+
+
+def load_exporter():
+    # the module name isn't a valid identifier, so it can't be imported normally
+    return imp.load_source('exporter', EXPORTER_PATH)
+
+
+def polyline_sql(sql, precision):
+    '''Wraps a layer query to return each line or polygon ring as GeoJSON.'''
+    return '''
+        SELECT ST_AsGeoJSON((ST_Dump(
+          CASE WHEN ST_Dimension(way) = 2 THEN ST_Boundary(way) ELSE way END
+        )).geom, %d) FROM (%s) AS layer WHERE NOT ST_IsEmpty(way)''' % (precision, sql)
+
+
+def layer_paths(conn, clip, criteria, width=render.SVG_WIDTH, precision=render.SVG_PRECISION,
+                simplify=None, paper=render.PAPER_SIZE):
+    '''
+    Yields (layer id, paths) pairs in the exporter's compiled path format:
+    straight segments as cubic superpaths whose control points sit on the nodes.
+    '''
+    projection = render.Projection(render.clip_bounds(conn, clip), width)
+
+    for (label, table, where) in criteria:
+        sql = render.layer_sql(table, where, projection)
+        if simplify:
+            sql = render.simplified_sql(sql, projection.tolerance(simplify, paper))
+
+        paths = []
+        for (geojson,) in render.iter_layer(conn, polyline_sql(sql, precision), clip):
+            coordinates = json.loads(geojson)['coordinates']
+            if len(coordinates) < 2:
+                continue
+            paths.append({
+                'type': 'vector',
+                'id': '%s-%d' % (label, len(paths) + 1),
+                'data': [[[p[:2], p[:2], p[:2]] for p in coordinates]],
+            })
+
+        print('- %s: %d paths' % (label, len(paths)), file=sys.stderr)
+        if paths:
+            yield (label, paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    render.add_connection_arguments(parser)
+    parser.add_argument('--criteria', type=argparse.FileType('r'), required=True,
+                        help='file of LAYER_NAME|TABLE_NAME|WHERE_CLAUSE lines')
+    parser.add_argument('--width', type=float, default=render.SVG_WIDTH, help='width of the drawing in px')
+    parser.add_argument('--precision', type=int, default=render.SVG_PRECISION, help='decimal places in coordinates')
+    parser.add_argument('--simplify', type=float, default=None, metavar='MM',
+                        help='merge lines and drop detail finer than this many mm on paper')
+    parser.add_argument('--paper', type=render.paper_size, default=render.PAPER_SIZE, metavar='WxH',
+                        help='size to scale the drawing to in mm (default: %dx%d)' % render.PAPER_SIZE)
+    parser.add_argument('--directory', required=True, help='directory to write the gcode files to')
+    parser.add_argument('--Xsplode', type=float, default=None, help='width to scale to in mm (default: paper width)')
+    parser.add_argument('--Ysplode', type=float, default=None, help='height to scale to in mm (default: paper height)')
+    parser.add_argument('--collapsepaths', choices=('true', 'false'), default='true',
+                        help='avoid pen-lifting for very small gaps')
+    parser.add_argument('clip', help='GeoJSON polygon to excerpt')
+    args = parser.parse_args()
+
+    exporter = load_exporter()
+    tools = exporter.Gcode_tools()
+    # fit to the paper unless told otherwise
+    tools.getoptions([
+        '--directory=%s' % args.directory,
+        '--Xsplode=%f' % (args.paper[0] if args.Xsplode is None else args.Xsplode),
+        '--Ysplode=%f' % (args.paper[1] if args.Ysplode is None else args.Ysplode),
+        '--collapsepaths=%s' % args.collapsepaths,
+    ])
+    if not tools.check_dir():
+        sys.exit(1)
+
+    conn = render.connect(args)
+    try:
+        layers = list(layer_paths(conn, args.clip, render.read_criteria(args.criteria),
+                                  args.width, args.precision, args.simplify, args.paper))
+    finally:
+        conn.close()
+
+    if not layers:
+        print('nothing to draw inside the clip', file=sys.stderr)
+        sys.exit(1)
+
+    tools.export_layers(layers)
+
+
+if __name__ == '__main__':
+    main()
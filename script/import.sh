@@ -0,0 +1,35 @@
+#!/bin/bash
+
+# imports a single .osm.bz2 extract (URL or local path) into tables named
+# after the given prefix, decompressing as it downloads. expects postgresql
+# to be running and the database to exist.
+
+set -eu -o pipefail
+
+source "$(dirname "$0")/common.sh"
+
+SRC="$1"
+PREFIX="${2:-planet_osm}"
+
+case "$SRC" in
+    *.bz2) DECOMPRESS="bzcat" ;;
+    *.gz) DECOMPRESS="zcat" ;;
+    *) DECOMPRESS="cat" ;;
+esac
+
+echo "- loading $SRC into $PREFIX tables"
+if [ -f "$SRC" ]; then
+    $DECOMPRESS < "$SRC"
+else
+    curl -sSf "$SRC" | $DECOMPRESS
+fi | osm2pgsql -s -C "$CACHE" -U postgres -d "$DBNAME" --prefix "$PREFIX" /dev/stdin
+
+# this seems dumb but the command line flags don't seem to work. the column
+# is left without an SRID constraint so that updates can be appended.
+for g in line point polygon; do
+    echo "
+        ALTER TABLE ${PREFIX}_$g ALTER COLUMN way SET DATA TYPE geometry
+            USING ST_TRANSFORM( ST_SETSRID( way, 900913), 4326 );" | psql -U postgres -q $DBNAME
+done
+
+echo "- finished loading $SRC"
@@ -0,0 +1,63 @@
+#!/bin/bash
+
+# builds spatial indexes matching the layer selection criteria, refreshes
+# planner statistics and checks that the excerpt queries will use them.
+# expects postgresql to be running.
+
+set -eu -o pipefail
+
+source "$(dirname "$0")/common.sh"
+PSQL="psql -U postgres -t -q -v ON_ERROR_STOP=1 $DBNAME"
+mkdir -p "$TMP"
+
+echo "- indexing DB $DBNAME"
+
+# rewriting the geometry column keeps the indexes osm2pgsql made, but tables
+# merged from several extracts start out without one
+for g in line point polygon; do
+    if [ -z "$(echo "SELECT indexname FROM pg_indexes
+        WHERE tablename = 'planet_osm_$g' AND indexdef ~ 'USING gist \(way\)$';" | $PSQL)" ]; then
+        echo "CREATE INDEX planet_osm_${g}_way_gist ON planet_osm_$g USING GIST (way);" | $PSQL
+    fi
+    # rewriting the column threw away its statistics. only the tables
+    # excerpts read from; the slim tables don't need it
+    echo "VACUUM ANALYZE planet_osm_$g;" | $PSQL
+done
+
+# one partial GiST index per layer, so that each excerpt only has to walk
+# the features its WHERE clause selects
+echo "$CRITERIA" > $TMP/index_criteria
+while IFS='' read -r criterion; do
+    LABEL="$(echo $criterion | cut -d '|' -f 1)"
+    TABLE="$(echo $criterion | cut -d '|' -f 2)"
+    WHERE="$(echo $criterion | cut -d '|' -f 3)"
+    echo "  - $LABEL"
+    echo "DROP INDEX IF EXISTS excerpt_${LABEL}_way_gist;" | $PSQL
+    echo "CREATE INDEX excerpt_${LABEL}_way_gist ON \"$TABLE\" USING GIST (way) WHERE ($WHERE);" | $PSQL
+done < $TMP/index_criteria
+
+# make sure the planner picks the indexes for a clip the size of a typical
+# drawing in the middle of the data
+CLIP="$(echo "SELECT ST_AsGeoJSON(ST_Expand(ST_Centroid(ST_EstimatedExtent('planet_osm_line', 'way')), 0.02));" | $PSQL | tr -d ' \n' || true)"
+if [ -z "$CLIP" ]; then
+    echo "  ! no statistics for planet_osm_line, cannot check whether excerpts use the indexes"
+    exit 0
+fi
+while IFS='' read -r criterion; do
+    LABEL="$(echo $criterion | cut -d '|' -f 1)"
+    TABLE="$(echo $criterion | cut -d '|' -f 2)"
+    WHERE="$(echo $criterion | cut -d '|' -f 3)"
+    PLAN="$(echo "EXPLAIN SELECT * FROM \"$TABLE\"
+      WHERE
+        ST_Intersects(way, ST_SetSRID(ST_GeomFromGeoJSON('$CLIP'), 4326))
+      AND
+        ($WHERE);" | $PSQL || true)"
+    if [ -z "$PLAN" ]; then
+        echo "  ! $LABEL: EXPLAIN failed, cannot tell whether excerpts will use an index"
+    elif echo "$PLAN" | grep -q 'Seq Scan on'; then
+        echo "  ! $LABEL excerpts will not use an index:"
+        echo "$PLAN"
+    else
+        echo "  - $LABEL: $(echo "$PLAN" | grep -o '[A-Za-z ]*Scan using [a-z_]*' | head -n 1 | sed 's/^ *//')"
+    fi
+done < $TMP/index_criteria
@@ -2,37 +2,32 @@
 
 set -eu -o pipefail
 
-TMP='/tmp/4xidraw'
+source "$(dirname "$0")/common.sh"
 mkdir -p "$TMP"
 
+# number of extracts to import at once. each one holds its own share of the
+# node cache in memory, so more jobs mean a smaller cache per extract
+JOBS="${JOBS:-2}"
+
 service postgresql start
 
-DOWNLOAD="$(echo "$1" | tr ',' ' ')"
-for D in $DOWNLOAD; do
-    echo "- downloading $D"
-    if [ ! -f "$TMP/$(basename $D .bz2)" ]; then
-        curl "$D" > "$TMP/$(basename $D)"
-        bunzip2 "$TMP/$(basename $D)"
-    fi
-
-    DBNAME="osm"
-    echo "- creating database $DBNAME"
-    dropdb --if-exists -U postgres "$DBNAME"
-    createdb -U postgres "$DBNAME"
-    echo "CREATE EXTENSION postgis;" | psql -U postgres "$DBNAME"
-
-    echo "- loading into DB $DBNAME"
-    osm2pgsql -s -U postgres -d "$DBNAME" "$TMP/$(basename $D .bz2)"
-
-    # this seems dumb but the command line flags don't seem to work
-    for g in line point polygon; do
-        echo "
-            SELECT UpdateGeometrySRID('planet_osm_$g', 'way', 4326);
-            UPDATE planet_osm_$g SET way = ST_TRANSFORM( ST_SETSRID( way, 900913), 4326 );
-            ALTER TABLE planet_osm_$g ALTER COLUMN way SET DATA TYPE geometry;" | psql -U postgres $DBNAME
-    done
-
-    rm "$TMP/$(basename $D .bz2)"
-done
-
-service postgresql stop
\ No newline at end of file
+echo "- creating database $DBNAME"
+dropdb --if-exists -U postgres "$DBNAME"
+createdb -U postgres "$DBNAME"
+echo "CREATE EXTENSION postgis;" | psql -U postgres "$DBNAME"
+
+# slim mode (without --drop) keeps the node/way/relation tables around so
+# that change files can be applied later with script/update.sh
+DOWNLOAD="$(echo "$1" | tr ',' '\n' | grep -v '^$')"
+if [ "$(echo "$DOWNLOAD" | wc -l)" -eq 1 ]; then
+    "$(dirname "$0")/import.sh" "$DOWNLOAD"
+else
+    # each extract gets its own set of tables, which are then merged
+    echo "$DOWNLOAD" | awk '{ print $0 " extract_" NR }' | \
+        CACHE=$((CACHE / JOBS)) xargs -P "$JOBS" -L 1 "$(dirname "$0")/import.sh"
+    merge_extracts
+fi
+
+"$(dirname "$0")/index.sh"
+
+service postgresql stop
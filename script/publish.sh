@@ -0,0 +1,48 @@
+#!/bin/bash
+
+# uploads one or more files to an S3 path, compressing them on the way out and
+# naming each after the SHA-256 of its contents so that identical results
+# aren't uploaded twice. prints the URL of each artifact.
+#
+#   script/publish.sh s3://my-output-bucket/maps out/*.gcode
+#
+# COMPRESS picks gzip (default) or zstd, JOBS the number of concurrent uploads
+# and S3_ENDPOINT an S3-compatible server to use instead of AWS.
+
+set -eu -o pipefail
+
+DEST="${1%/}"
+shift
+
+export DEST
+export COMPRESS="${COMPRESS:-gzip}"
+export AWS="aws"
+if [ -n "${S3_ENDPOINT:-}" ]; then AWS="aws --endpoint-url $S3_ENDPOINT"; fi
+JOBS="${JOBS:-4}"
+
+publish() {
+    local f="$1"
+    local name="$(basename "$f")"
+    local hash="$(sha256sum < "$f" | cut -d ' ' -f 1)"
+
+    local compressor="gzip -c"
+    local suffix="gz"
+    if [ "$COMPRESS" = "zstd" ]; then
+        compressor="zstd -q -c"
+        suffix="zst"
+    fi
+    local key="$DEST/$hash.${name#*.}.$suffix"
+
+    if $AWS s3 ls "$key" > /dev/null 2>&1; then
+        echo "$key"
+        return
+    fi
+
+    # streamed straight from the compressor; the CLI switches to a multipart
+    # upload for anything bigger than its threshold
+    $compressor < "$f" | $AWS s3 cp --quiet - "$key" --expected-size "$(stat -c %s "$f")"
+    echo "$key"
+}
+export -f publish
+
+printf '%s\0' "$@" | xargs -0 -n 1 -P "$JOBS" bash -c 'set -eu -o pipefail; publish "$1"' publish
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+'''
+Renders the OSM features inside a clip polygon to an SVG with one Inkscape
+layer per selection criterion.
+
+Geometry is clipped, projected and serialized by PostGIS and streamed through
+a server-side cursor, so memory use doesn't grow with the size of the excerpt.
+The projection is plain lon/lat scaled to the requested width, with north up.
+Optionally, geometry is merged, simplified and snapped to a grid no finer than
+the pen can draw at the size the drawing will be plotted.
+'''
+
+from __future__ import division, print_function
+
+import argparse
+import sys
+from xml.sax.saxutils import quoteattr
+
+import psycopg2
+
+SVG_WIDTH = 1000.0
+SVG_PRECISION = 2
+CURSOR_ITERSIZE = 2000
+
+# plottable area of the 4xiDraw in mm
+PAPER_SIZE = (270.0, 200.0)
+
+LAYER_STYLE = 'fill:none;stroke:#000000;stroke-width:1'
+
+SVG_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" version="1.1" width="%(width).2f" height="%(height).2f" viewBox="0 0 %(width).2f %(height).2f">
+'''
+SVG_FOOTER = '</svg>\n'
+
+CLIP_SQL = 'ST_SetSRID(ST_GeomFromGeoJSON(%(clip)s), 4326)'
+
+
+def read_criteria(f):
+    '''Parses LAYER_NAME|TABLE_NAME|WHERE_CLAUSE lines into tuples.'''
+    criteria = []
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        (label, table, where) = line.split('|', 2)
+        criteria.append((label, table, where))
+    return criteria
+
+
+class Projection(object):
+    '''Maps lon/lat inside the clip's bounding box onto a canvas `width` wide.'''
+
+    def __init__(self, bounds, width=SVG_WIDTH):
+        (self.minx, self.miny, self.maxx, self.maxy) = bounds
+        self.scale = width / (self.maxx - self.minx)
+        self.width = width
+        self.height = (self.maxy - self.miny) * self.scale
+
+    def affine_sql(self, geometry):
+        # ST_AsSVG negates y, so translating the top edge to 0 leaves the
+        # output pointing down the page like the SVG coordinate system
+        return 'ST_Affine(%s, %r, 0, 0, %r, %r, %r)' % (
+            geometry, self.scale, self.scale,
+            -self.minx * self.scale, -self.maxy * self.scale)
+
+    def tolerance(self, resolution, paper=PAPER_SIZE):
+        '''Converts a distance in mm on paper into canvas units.'''
+        mm_per_unit = min(paper[0] / self.width, paper[1] / self.height)
+        return resolution / mm_per_unit
+
+
+def clip_bounds(conn, clip):
+    cur = conn.cursor()
+    cur.execute(
+        'SELECT ST_XMin(clip), ST_YMin(clip), ST_XMax(clip), ST_YMax(clip) FROM (SELECT %s AS clip) AS c' % CLIP_SQL,
+        {'clip': clip})
+    bounds = cur.fetchone()
+    cur.close()
+    return bounds
+
+
+def layer_sql(table, where, projection):
+    '''
+    Returns a query for (osm_id, way) rows of the features selected by a layer,
+    clipped and projected. Points are dropped since they can't be drawn.
+    '''
+    # the WHERE clause is repeated verbatim so the layer's partial index applies;
+    # only literal %s need escaping from the driver's parameter substitution
+    clipped = 'ST_CollectionExtract(ST_Intersection(way, %s), ST_Dimension(way) + 1)' % CLIP_SQL
+    return '''
+        SELECT osm_id, %(way)s AS way FROM "%(table)s"
+        WHERE
+          ST_Intersects(way, %(clip)s)
+        AND
+          ST_Dimension(way) > 0
+        AND
+          (%(where)s)''' % {
+        'way': projection.affine_sql(clipped),
+        'table': table,
+        'clip': CLIP_SQL,
+        'where': where.replace('%', '%%'),
+    }
+
+
+def simplified_sql(sql, tolerance):
+    '''
+    Wraps a layer query so lines are merged end to end, then everything is
+    simplified and snapped to a grid `tolerance` apart. Merged lines lose their
+    osm_id.
+    '''
+    simplify = 'ST_SnapToGrid(ST_SimplifyPreserveTopology(way, %(tolerance)r), %(tolerance)r)'
+    return '''
+        WITH layer AS (%(sql)s)
+        SELECT NULL AS osm_id, %(simplify)s AS way FROM (
+          SELECT (ST_Dump(ST_LineMerge(ST_Collect(way)))).geom AS way FROM (
+            SELECT (ST_Dump(way)).geom AS way FROM layer WHERE ST_Dimension(way) = 1
+          ) AS lines
+        ) AS merged
+        UNION ALL
+        SELECT osm_id, %(simplify)s AS way FROM layer WHERE ST_Dimension(way) = 2''' % {
+        'sql': sql,
+        'simplify': simplify % {'tolerance': tolerance},
+    }
+
+
+def iter_layer(conn, sql, clip, name='layer'):
+    '''Streams the rows of a layer query through a server-side cursor.'''
+    cur = conn.cursor(name=name)
+    cur.itersize = CURSOR_ITERSIZE
+    cur.execute(sql, {'clip': clip})
+    try:
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+
+
+def paper_size(value):
+    try:
+        (w, h) = [float(v) for v in value.lower().split('x')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected WIDTHxHEIGHT in mm, not %r' % value)
+    return (w, h)
+
+
+def add_connection_arguments(parser):
+    parser.add_argument('--dbname', default='osm', help='database holding the OSM extract')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--host', default=None, help='database host (default: local socket)')
+    parser.add_argument('--port', default=None)
+
+
+def connect(args):
+    params = {'dbname': args.dbname, 'user': args.user}
+    if args.host:
+        params['host'] = args.host
+    if args.port:
+        params['port'] = args.port
+    return psycopg2.connect(**params)
+
+
+def render(conn, clip, criteria, out, width=SVG_WIDTH, precision=SVG_PRECISION, simplify=None, paper=PAPER_SIZE):
+    projection = Projection(clip_bounds(conn, clip), width)
+    out.write(SVG_HEADER % {'width': projection.width, 'height': projection.height})
+
+    for (label, table, where) in criteria:
+        sql = layer_sql(table, where, projection)
+        if simplify:
+            sql = simplified_sql(sql, projection.tolerance(simplify, paper))
+        sql = 'SELECT ST_AsSVG(way, 0, %d) FROM (%s) AS layer WHERE NOT ST_IsEmpty(way)' % (precision, sql)
+
+        # layers are only opened once they have something in them
+        count = 0
+        for (d,) in iter_layer(conn, sql, clip):
+            if count == 0:
+                out.write('<g id=%s inkscape:groupmode="layer" inkscape:label=%s style="%s">\n' % (
+                    quoteattr(label), quoteattr(label), LAYER_STYLE))
+            count += 1
+            out.write('<path id=%s d="%s"/>\n' % (quoteattr('%s-%d' % (label, count)), d))
+        if count > 0:
+            out.write('</g>\n')
+
+        print('- %s: %d features' % (label, count), file=sys.stderr)
+
+    out.write(SVG_FOOTER)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    add_connection_arguments(parser)
+    parser.add_argument('--criteria', type=argparse.FileType('r'), required=True,
+                        help='file of LAYER_NAME|TABLE_NAME|WHERE_CLAUSE lines')
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument('--width', type=float, default=SVG_WIDTH, help='width of the drawing in px')
+    parser.add_argument('--precision', type=int, default=SVG_PRECISION, help='decimal places in path data')
+    parser.add_argument('--simplify', type=float, default=None, metavar='MM',
+                        help='merge lines and drop detail finer than this many mm on paper')
+    parser.add_argument('--paper', type=paper_size, default=PAPER_SIZE, metavar='WxH',
+                        help='size the drawing will be plotted at in mm (default: %dx%d)' % PAPER_SIZE)
+    parser.add_argument('clip', help='GeoJSON polygon to excerpt')
+    args = parser.parse_args()
+
+    conn = connect(args)
+    try:
+        render(conn, args.clip, read_criteria(args.criteria), args.output,
+               args.width, args.precision, args.simplify, args.paper)
+    finally:
+        conn.close()
+    args.output.close()
+
+
+if __name__ == '__main__':
+    main()
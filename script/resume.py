@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+'''
+Writes gcode that resumes a plot partway through, using the index the 4xiDraw
+exporter writes next to each gcode file (e.g. road.index.json for road.gcode).
+
+The job restarts at the beginning of a path, chosen by its id or by a byte
+offset into the gcode (which snaps back to the start of the path containing
+it). A preamble lifts the pen, moves to where the machine would have been and
+puts the pen back down if it was drawing, then the rest of the original file
+follows unchanged.
+'''
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import sys
+
+INDEX_EXTENSION = 'index.json'
+
+
+def index_path(gcode_path):
+    return '%s.%s' % (os.path.splitext(gcode_path)[0], INDEX_EXTENSION)
+
+
+def find_path(index, path_id=None, offset=None):
+    '''Returns the index entry to resume from, or None.'''
+    if path_id is not None:
+        for entry in index['paths']:
+            if entry['id'] == path_id:
+                return entry
+        return None
+
+    found = None
+    for entry in index['paths']:
+        if entry['offset'] > offset:
+            break
+        found = entry
+    return found
+
+
+def preamble(index, entry, source):
+    lines = [
+        '; RESUMED FROM %s AT PATH %s (byte %d, ~%ds in)' % (source, entry['id'], entry['offset'], entry['time']),
+        'G21 ; All units in mm',
+        'G90',
+    ]
+    gcode = '\n'.join(lines) + '\n' + index['pen_up']
+    if entry['x'] is not None and entry['y'] is not None:
+        gcode += 'G00 X%.5f Y%.5f F%d\n' % (entry['x'], entry['y'], index['feed'] or 12000)
+        if entry['pen_down']:
+            gcode += index['pen_down']
+    return gcode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('gcode', help='gcode file written by the exporter')
+    start = parser.add_mutually_exclusive_group(required=True)
+    start.add_argument('--id', dest='path_id', help='id of the path to resume from')
+    start.add_argument('--offset', type=int, help='byte offset in the gcode to resume from')
+    start.add_argument('--list', action='store_true', help='list the paths in the index and exit')
+    parser.add_argument('--output', type=argparse.FileType('wb'), default=None, help='default: stdout')
+    args = parser.parse_args()
+
+    with open(index_path(args.gcode)) as f:
+        index = json.load(f)
+
+    if args.list:
+        for entry in index['paths']:
+            print('%s\t%d\t%.1fs' % (entry['id'], entry['offset'], entry['time']))
+        return
+
+    entry = find_path(index, args.path_id, args.offset)
+    if entry is None:
+        print('no path found to resume from', file=sys.stderr)
+        sys.exit(1)
+
+    out = args.output or getattr(sys.stdout, 'buffer', sys.stdout)
+    out.write(preamble(index, entry, os.path.basename(args.gcode)).encode('ascii'))
+    with open(args.gcode, 'rb') as f:
+        f.seek(entry['offset'])
+        shutil.copyfileobj(f, out)
+    out.flush()
+
+
+if __name__ == '__main__':
+    main()
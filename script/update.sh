@@ -0,0 +1,37 @@
+#!/bin/bash
+
+# applies an OSM change file (.osc, .osc.gz or .osc.bz2) to the loaded extract.
+# images built from several extracts need the prefix of the extract the
+# change file belongs to (extract_1, extract_2... in the order they were given).
+
+set -eu -o pipefail
+
+source "$(dirname "$0")/common.sh"
+
+CHANGES="$1"
+PREFIX="${2:-planet_osm}"
+if [ ! -f "$CHANGES" ]; then
+    echo "change file $CHANGES not found"
+    exit 1
+fi
+
+service postgresql start
+
+echo "- applying $CHANGES to $PREFIX tables in DB $DBNAME"
+osm2pgsql --append -s -C "$CACHE" -U postgres -d "$DBNAME" --prefix "$PREFIX" "$CHANGES"
+
+echo "- reprojecting changed features"
+reproject "$PREFIX"
+
+if [ "$PREFIX" = "planet_osm" ]; then
+    # the layer indexes are maintained by postgres, only statistics need a refresh
+    for g in line point polygon; do
+        echo "ANALYZE planet_osm_$g;" | psql -U postgres -q -v ON_ERROR_STOP=1 $DBNAME
+    done
+else
+    # this extract's copy of each feature replaces the others
+    merge_extracts "$PREFIX"
+    "$(dirname "$0")/index.sh"
+fi
+
+service postgresql stop